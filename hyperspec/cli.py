@@ -23,10 +23,14 @@ def register(
     *,
     smooth: float = 0.0,
     debug: bool = False,
+    feature_cache: Union[Path, None] = None,
 ):
     """
     Runs the registration process.
 
+    If `--feature-cache` is given, the features detected in the previews are stored in that directory and reused by
+    later runs with the same previews, e.g. the destination when registering many captures to one master capture.
+
     Example:
         hyperspec register 2023-03-09_014/results/REFLECTANCE_2023-03-09_014.hdr \
             2023-03-09_015/results/REFLECTANCE_2023-03-09_015.hdr bounds.json registered.zarr
@@ -47,7 +51,11 @@ def register(
     src_cube = read_cube(src_path, bounds=crop_bounds, smooth=smooth)
     dst_cube = read_cube(dst_path, bounds=crop_bounds, smooth=smooth)
 
-    result, result_preview, matched_vis = registration.register(dst_preview, dst_cube, src_preview, src_cube)
+    cache = registration.FeatureCache(directory=feature_cache) if feature_cache is not None else None
+
+    result, result_preview, matched_vis = registration.register(
+        dst_preview, dst_cube, src_preview, src_cube, feature_cache=cache
+    )
     if result is None or result_preview is None:
         _err = "Registration failed"
         raise ValueError(_err)
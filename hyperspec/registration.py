@@ -1,5 +1,12 @@
+import functools
+import hashlib
 import json
 import logging
+import os
+import tempfile
+from collections import OrderedDict
+from collections.abc import Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
 from os import PathLike
 from pathlib import Path
 from typing import Any
@@ -16,9 +23,19 @@ import xarray as xr
 
 from hyperspec.io import read_preview
 
-__all__ = ["register", "crop", "read_crop_db"]
+__all__ = ["FeatureCache", "detect_features", "register", "crop", "read_crop_db"]
 logger = logging.getLogger(__name__)
 
+_FLANN_INDEX_LSH = 6
+# bump whenever the layout of the feature files written by `FeatureCache` changes
+_FEATURE_CACHE_VERSION = 1
+# homogeneous coordinates of the unit square corners, used to check the area scaling of homographies
+_UNIT_SQUARE = np.array([[0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1]], np.float64)
+# initial ORB feature budget and the number of RANSAC inliers needed to accept it (see `register`)
+_INITIAL_NFEATURES = 2_000
+_MIN_INLIERS = 50
+_ORB_CREATE_DEFAULTS = {"nfeatures": 10_000, "scaleFactor": 1.2, "scoreType": cv2.ORB_HARRIS_SCORE, "WTA_K": 2}
+
 
 def validate_homography(homog: npt.NDArray[np.float_]):
     logger.info(f"Validating homography for {homog}")
@@ -34,9 +51,10 @@ def validate_homography(homog: npt.NDArray[np.float_]):
 
     # must approximately preserve area (to within a tolerance appropriate for us)
     # NOTE: Order of points is important here to provide a valid contour
-    points = np.array([[0, 0], [1, 0], [1, 1], [0, 1]], np.float32)
-    transformed = cv2.perspectiveTransform(points[None, :, :], homog).squeeze()
-    area = cv2.contourArea(transformed)
+    transformed = _UNIT_SQUARE @ homog.T
+    transformed = transformed[:, :2] / transformed[:, 2:3]
+    x, y = transformed[:, 0], transformed[:, 1]
+    area = 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
     tol = 0.1
     if area < 1.0 - tol or area > 1.0 + tol:
         _err = f"Homography does not preserve area to within a {int(tol*100)}% ({area})"
@@ -48,6 +66,276 @@ def validate_homography(homog: npt.NDArray[np.float_]):
         raise ValueError(_err)
 
 
+def _warp_cube(
+    cube: npt.NDArray, homog: npt.NDArray[np.float_], dsize: tuple[int, int], preview: npt.NDArray | None = None
+) -> tuple[npt.NDArray, npt.NDArray | None]:
+    """Warp every band of a (y, x, band) array, passing up to 4 bands to OpenCV per call as a multi-channel image.
+
+    A greyscale `preview` with the same (y, x) shape can be warped alongside the cube, filling a spare channel of the
+    last tile where there is one. The warped preview is returned with the warped cube (or None if not given).
+    """
+    width, height = dsize
+    n_bands = cube.shape[-1]
+    out = np.empty((height, width, n_bands), dtype=cube.dtype)
+
+    tiles = [(b0, cube[..., b0 : b0 + 4]) for b0 in range(0, n_bands, 4)]
+    if preview is not None:
+        if n_bands % 4:
+            b0, tile = tiles[-1]
+            tiles[-1] = (b0, np.dstack([tile, preview.astype(cube.dtype)]))
+        else:
+            tiles.append((n_bands, preview.astype(cube.dtype)))
+
+    out_preview = np.empty((height, width), dtype=cube.dtype) if preview is not None else None
+
+    def _warp_tile(b0_tile: tuple[int, npt.NDArray]):
+        b0, tile = b0_tile
+        warped = cv2.warpPerspective(np.ascontiguousarray(tile), homog, dsize, borderValue=(-999,) * 4)
+        warped = warped.reshape(height, width, -1)
+        n_cube = max(0, min(4, n_bands - b0))
+        out[..., b0 : b0 + n_cube] = warped[..., :n_cube]
+        # copy rather than return the preview channel so that no warped tile outlives its own call
+        if warped.shape[-1] > n_cube:
+            out_preview[...] = warped[..., n_cube]  # type: ignore
+
+    # The tiles are independent and OpenCV releases the GIL, so warp them concurrently. The pool is bounded by the
+    # number of tiles and cores rather than changing OpenCV's (process-wide) thread count.
+    with ThreadPoolExecutor(max_workers=min(len(tiles), os.cpu_count() or 1)) as executor:
+        for _ in executor.map(_warp_tile, tiles):
+            pass
+
+    return out, out_preview
+
+
+def _crop_invalid_border(cube: xr.DataArray) -> tuple[xr.DataArray, int]:
+    """Symmetrically crop a (y, x, band) cube until no negative (invalid) values remain, returning the crop width."""
+    # Find the smallest symmetric inset that excludes every invalid pixel in one pass, rather than shrinking by
+    # one pixel and rescanning the whole cube until no invalid values remain.
+    invalid = (cube.values < 0).any(axis=-1)
+    if not invalid.any():
+        return cube, 0
+    height, width = invalid.shape
+    yy, xx = np.nonzero(invalid)
+    border = int(np.minimum.reduce([yy, height - 1 - yy, xx, width - 1 - xx]).max()) + 1
+    return cube[border : height - border, border : width - border, :], border
+
+
+def detect_features(
+    preview: npt.NDArray, *, orb_create_kwargs: dict[str, Any] | None = None, detect_scale: float = 1.0
+) -> tuple[tuple[cv2.KeyPoint, ...], npt.NDArray | None]:
+    """
+    Detects ORB keypoints and computes their descriptors for a preview image.
+    Args:
+      preview (npt.NDArray): Preview image (BGR or greyscale).
+      orb_create_kwargs (dict[str, Any] | None): Keyword arguments for ORB creation.
+      detect_scale (float): Factor the preview is resized by before detection.
+    Returns:
+      tuple[tuple[cv2.KeyPoint, ...], npt.NDArray | None]: The keypoints (in the resized preview's coordinates) and
+                                                           their descriptors.
+    Notes:
+      The result can be passed to `register` as `dst_features` / `src_features` to avoid repeating the detection when
+      registering many captures to the same destination. The same `orb_create_kwargs` and `detect_scale` should be
+      used for both.
+    Examples:
+      >>> dst_features = detect_features(dst_preview)
+      >>> for src_preview, src_cube in captures:
+      ...     register(dst_preview, dst_cube, src_preview, src_cube, dst_features=dst_features)
+    """
+    preview = _to_grey_uint8(preview)
+
+    _orb_create_kwargs = dict(_ORB_CREATE_DEFAULTS)
+    _orb_create_kwargs.update(orb_create_kwargs or {})
+    orb = cv2.ORB_create(**_orb_create_kwargs)
+    return _detect(_resize(preview, detect_scale), orb)
+
+
+def _to_grey_uint8(preview: npt.NDArray) -> npt.NDArray[np.uint8]:
+    """Convert a preview to the 8-bit greyscale image ORB works on, so OpenCV doesn't convert it on every call."""
+    if preview.dtype != np.uint8:
+        preview = np.clip(preview, 0, 255).astype(np.uint8)
+    if preview.ndim != 2:
+        preview = cv2.cvtColor(preview, cv2.COLOR_BGR2GRAY)
+    return preview
+
+
+def _resize(preview: npt.NDArray, scale: float) -> npt.NDArray:
+    if scale == 1.0:
+        return preview
+    return cv2.resize(preview, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def _lift_homography(homog: npt.NDArray[np.float_], scale: float) -> npt.NDArray[np.float_]:
+    """Convert a homography between previews resized by `scale` into one between the full resolution previews."""
+    # maps resized pixel centres onto full resolution pixel centres (x_full = (x + 0.5) / scale - 0.5)
+    offset = 0.5 / scale - 0.5
+    lift = np.array([[1.0 / scale, 0.0, offset], [0.0, 1.0 / scale, offset], [0.0, 0.0, 1.0]])
+    return lift @ homog @ np.linalg.inv(lift)
+
+
+class FeatureCache:
+    """
+    Caches the ORB features detected in previews across calls to `register`.
+
+    Keeping one cache for repeated registrations (e.g. re-running registration interactively, or registering many
+    captures to one destination) means features, and the image pyramids ORB builds to find them, are only computed
+    once for each preview array. If a `directory` is given, features are also stored on disk (keyed on the preview
+    content and detection settings) so that they can be reused by later processes, e.g. separate CLI invocations.
+
+    Notes:
+      In memory, entries are keyed on the preview's memory buffer (data pointer, shape, strides and dtype) and the
+      detection settings, not its content, so a preview modified in place will reuse stale features. The cache holds a
+      reference to each cached preview so that its buffer cannot be reused by another array.
+    Examples:
+      >>> cache = FeatureCache()
+      >>> for src_preview, src_cube in captures:
+      ...     register(dst_preview, dst_cube, src_preview, src_cube, feature_cache=cache)
+    """
+
+    def __init__(self, maxsize: int = 8, directory: PathLike | str | None = None):
+        self.maxsize = maxsize
+        self.directory = Path(directory) if directory is not None else None
+        self._entries: OrderedDict[tuple, tuple[npt.NDArray, tuple[tuple[cv2.KeyPoint, ...], npt.NDArray | None]]] = (
+            OrderedDict()
+        )
+
+    def get(
+        self,
+        preview: npt.NDArray,
+        settings: tuple,
+        detect: Callable[[], tuple[tuple[cv2.KeyPoint, ...], npt.NDArray | None]],
+    ) -> tuple[tuple[cv2.KeyPoint, ...], npt.NDArray | None]:
+        """Return the cached features for `preview` and `settings`, calling `detect` to compute them on a miss."""
+        key = (preview.ctypes.data, preview.shape, preview.strides, preview.dtype.str, settings)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key][1]
+
+        path = self._path(preview, settings) if self.directory is not None else None
+        if path is not None and path.exists():
+            features = _load_features(path)
+        else:
+            features = detect()
+            if path is not None and features[1] is not None:
+                _save_features(path, features)
+
+        self._entries[key] = (preview, features)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return features
+
+    def clear(self):
+        self._entries.clear()
+
+    def _path(self, preview: npt.NDArray, settings: tuple) -> Path:
+        digest = hashlib.sha256(preview.tobytes())
+        digest.update(str((preview.shape, preview.dtype.str, _FEATURE_CACHE_VERSION, settings)).encode())
+        return self.directory / f"{digest.hexdigest()}.npz"  # type: ignore
+
+
+def _save_features(path: Path, features: tuple[Sequence[cv2.KeyPoint], npt.NDArray]):
+    keypoints, descriptors = features
+    packed = np.array(
+        [(*kp.pt, kp.size, kp.angle, kp.response, kp.octave, kp.class_id) for kp in keypoints], dtype=np.float64
+    )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Several processes may share a cache directory, so write to a temporary file and move it into place, so that
+    # readers never see a partially written file
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".npz.tmp")
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            np.savez(fp, keypoints=packed, descriptors=descriptors)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _load_features(path: Path) -> tuple[tuple[cv2.KeyPoint, ...], npt.NDArray]:
+    with np.load(path) as cached:
+        keypoints = tuple(
+            cv2.KeyPoint(x, y, size, angle, response, int(octave), int(class_id))
+            for x, y, size, angle, response, octave, class_id in cached["keypoints"].tolist()
+        )
+        return keypoints, cached["descriptors"]
+
+
+def _detect(preview: npt.NDArray, orb: cv2.ORB) -> tuple[tuple[cv2.KeyPoint, ...], npt.NDArray | None]:
+    keypoints, descriptors = orb.detectAndCompute(preview, None)
+    return tuple(keypoints), descriptors
+
+
+def _cached_detect(
+    preview: npt.NDArray,
+    detect_preview: npt.NDArray,
+    orb: cv2.ORB,
+    settings: tuple,
+    feature_cache: FeatureCache | None,
+) -> tuple[tuple[cv2.KeyPoint, ...], npt.NDArray | None]:
+    """Detect features in `detect_preview`, the prepared version of `preview`, going through the cache if given."""
+    if feature_cache is None:
+        return _detect(detect_preview, orb)
+    return feature_cache.get(preview, settings, lambda: _detect(detect_preview, orb))
+
+
+def _match_descriptors(
+    descriptors_src: npt.NDArray | None,
+    descriptors_dst: npt.NDArray | None,
+    *,
+    wta_k: int,
+    use_flann: bool,
+    flann_index_kwargs: dict[str, Any] | None,
+    bfmatcher_kwargs: dict[str, Any] | None,
+    ratio_test: float,
+) -> list[cv2.DMatch]:
+    """Match ORB descriptors, using an approximate FLANN LSH index where the descriptors allow it."""
+    # no features were found in (at least) one of the previews
+    if descriptors_src is None or descriptors_dst is None:
+        return []
+
+    # LSH hashes individual descriptor bits, so it is only valid for plain Hamming (WTA_K=2) ORB descriptors
+    if use_flann and wta_k == 2:
+        _flann_index_kwargs = {"algorithm": _FLANN_INDEX_LSH, "table_number": 6, "key_size": 12, "multi_probe_level": 1}
+        _flann_index_kwargs.update(flann_index_kwargs or {})
+        matcher = cv2.FlannBasedMatcher(_flann_index_kwargs, {})
+        knn_matches = matcher.knnMatch(descriptors_src, descriptors_dst, k=2)
+        return [pair[0] for pair in knn_matches if len(pair) == 2 and pair[0].distance < ratio_test * pair[1].distance]
+
+    if use_flann:
+        logger.info(f"FLANN LSH matching requires WTA_K=2 (got {wta_k}). Falling back to brute-force matching.")
+
+    # Plain Hamming distance maps onto hardware popcount; HAMMING2 is only needed for WTA_K=3/4 descriptors
+    norm_type = cv2.NORM_HAMMING if wta_k == 2 else cv2.NORM_HAMMING2
+    _bfmatcher_kwargs = {"normType": norm_type, "crossCheck": True}
+    _bfmatcher_kwargs.update(bfmatcher_kwargs or {})
+
+    matcher = cv2.BFMatcher_create(**_bfmatcher_kwargs)
+    return list(matcher.match(descriptors_src, descriptors_dst))
+
+
+def _find_homography(
+    keypoints_src: Sequence[cv2.KeyPoint],
+    keypoints_dst: Sequence[cv2.KeyPoint],
+    matches: Sequence[cv2.DMatch],
+    reproj_threshold: float,
+) -> tuple[npt.NDArray[np.float_] | None, int]:
+    """Fit a homography to the matched keypoints with RANSAC, returning it (or None) and the number of inliers."""
+    # NOTE: KeyPoint_convert returns an empty tuple (not an array) when there are no keypoints
+    kp_src_xy = np.asarray(cv2.KeyPoint_convert(keypoints_src), dtype=np.float32).reshape(-1, 2)
+    kp_dst_xy = np.asarray(cv2.KeyPoint_convert(keypoints_dst), dtype=np.float32).reshape(-1, 2)
+    src_idx = np.fromiter((m.queryIdx for m in matches), dtype=np.int32, count=len(matches))
+    dst_idx = np.fromiter((m.trainIdx for m in matches), dtype=np.int32, count=len(matches))
+    pts_src = kp_src_xy[src_idx][:, None, :]
+    pts_dst = kp_dst_xy[dst_idx][:, None, :]
+    try:
+        homog, mask = cv2.findHomography(pts_src, pts_dst, method=cv2.RANSAC, ransacReprojThreshold=reproj_threshold)
+    except cv2.error as err:
+        logger.info(f"Homography fit failed: {err.msg}")
+        return None, 0
+    if homog is None:
+        return None, 0
+    return homog, int(mask.sum())
+
+
 def register(
     dst_preview: npt.NDArray,
     dst_cube: xr.DataArray,
@@ -56,7 +344,14 @@ def register(
     *,
     crop_registered: bool = True,
     orb_create_kwargs: dict[str, Any] | None = None,
+    use_flann: bool = False,
+    flann_index_kwargs: dict[str, Any] | None = None,
+    ratio_test: float = 0.8,
     bfmatcher_kwargs: dict[str, Any] | None = None,
+    dst_features: tuple[Sequence[cv2.KeyPoint], npt.NDArray] | None = None,
+    src_features: tuple[Sequence[cv2.KeyPoint], npt.NDArray] | None = None,
+    detect_scale: float = 1.0,
+    feature_cache: FeatureCache | None = None,
 ) -> tuple[xr.DataArray | None, npt.NDArray | None, npt.NDArray]:
     """
     Registers the source cube to the destination cube.
@@ -65,8 +360,25 @@ def register(
       dst_cube (xr.DataArray): Destination cube.
       src_preview (npt.NDArray): Preview of the source cube.
       src_cube (xr.DataArray): Source cube.
-      orb_create_kwargs (dict[str, Any] | None): Keyword arguments for ORB creation.
+      orb_create_kwargs (dict[str, Any] | None): Keyword arguments for ORB creation. Unless `nfeatures` is given,
+                                                 detection starts with 2,000 features and only retries with the full
+                                                 10,000 if fewer than 50 homography inliers are found (unless
+                                                 `dst_features` or `src_features` are given).
+      use_flann (bool): Whether to match descriptors with a FLANN LSH index. This is much faster for large feature sets
+                        but the index is randomised, so results are not reproducible between calls. Falls back to the
+                        brute-force matcher if the ORB descriptors are not plain Hamming descriptors (i.e. WTA_K != 2).
+      flann_index_kwargs (dict[str, Any] | None): Keyword arguments for the FLANN LSH index parameters.
+      ratio_test (float): Maximum ratio of the best to second best match distance for FLANN matches to be kept.
       bfmatcher_kwargs (dict[str, Any] | None): Keyword arguments for the brute-force matcher creation.
+      dst_features (tuple[Sequence[cv2.KeyPoint], npt.NDArray] | None): Precomputed keypoints and descriptors of the
+                                                                        destination preview (see `detect_features`).
+      src_features (tuple[Sequence[cv2.KeyPoint], npt.NDArray] | None): Precomputed keypoints and descriptors of the
+                                                                        source preview (see `detect_features`).
+      detect_scale (float): Factor the previews are resized by for feature detection. The homography found between
+                            the resized previews is scaled back up before warping the full resolution cube. Values
+                            below 1.0 make detection cheaper at the cost of sub-pixel registration accuracy.
+      feature_cache (FeatureCache | None): Cache used to reuse features detected in the same preview arrays by earlier
+                                           calls.
     Returns:
       tuple[xr.DataArray | None, npt.NDArray | None, npt.NDArray]: The registered cube, the registered preview, and the
                                                                    matched keypoints visualization.
@@ -79,61 +391,101 @@ def register(
       (xr.DataArray, npt.NDArray, npt.NDArray)
     """
 
-    if dst_preview.ndim != 2:
-        dst_preview = cv2.cvtColor(dst_preview, cv2.COLOR_BGR2GRAY)
-    if src_preview.ndim != 2:
-        src_preview = cv2.cvtColor(src_preview, cv2.COLOR_BGR2GRAY)
+    # the caller's arrays identify the previews in the feature cache
+    dst_input, src_input = dst_preview, src_preview
+    dst_preview = _to_grey_uint8(dst_preview)
+    src_preview = _to_grey_uint8(src_preview)
 
     # TODO: Try all 4 rotations
-    _orb_create_kwargs = {"nfeatures": 10_000, "scaleFactor": 1.2, "scoreType": cv2.ORB_HARRIS_SCORE, "WTA_K": 4}
+    _orb_create_kwargs = dict(_ORB_CREATE_DEFAULTS)
     _orb_create_kwargs.update(orb_create_kwargs or {})
-    orb = cv2.ORB_create(**_orb_create_kwargs)
-
-    keypoints_src, descriptors_src = orb.detectAndCompute(src_preview, None)
-    keypoints_dst, descriptors_dst = orb.detectAndCompute(dst_preview, None)
 
-    _bfmatcher_kwargs = {"normType": cv2.NORM_HAMMING2, "crossCheck": True}
-    _bfmatcher_kwargs.update(bfmatcher_kwargs or {})
+    # Registration quality saturates well below the full feature budget, so try a cheap pass first and only escalate
+    # if RANSAC finds too few inliers. Precomputed features have a fixed budget, so in that case (or if the caller has
+    # fixed the budget) use a single pass so that both previews are matched with the same number of features.
+    if "nfeatures" in (orb_create_kwargs or {}) or src_features is not None or dst_features is not None:
+        nfeatures_attempts = [_orb_create_kwargs["nfeatures"]]
+    else:
+        nfeatures_attempts = [_INITIAL_NFEATURES, _orb_create_kwargs["nfeatures"]]
+
+    # Optionally find features on reduced resolution previews; the ORB detection cost scales with the number of pixels
+    detect_src = _resize(src_preview, detect_scale)
+    detect_dst = _resize(dst_preview, detect_scale)
+
+    for nfeatures in nfeatures_attempts:
+        attempt_kwargs = {**_orb_create_kwargs, "nfeatures": nfeatures}
+        orb = cv2.ORB_create(**attempt_kwargs)
+
+        settings = (detect_scale, tuple(sorted(attempt_kwargs.items())))
+        keypoints_src, descriptors_src = (
+            src_features
+            if src_features is not None
+            else _cached_detect(src_input, detect_src, orb, settings, feature_cache)
+        )
+        keypoints_dst, descriptors_dst = (
+            dst_features
+            if dst_features is not None
+            else _cached_detect(dst_input, detect_dst, orb, settings, feature_cache)
+        )
 
-    matcher = cv2.BFMatcher_create(**_bfmatcher_kwargs)
-    matches = matcher.match(descriptors_src, descriptors_dst)
+        matches = _match_descriptors(
+            descriptors_src,
+            descriptors_dst,
+            wta_k=_orb_create_kwargs["WTA_K"],
+            use_flann=use_flann,
+            flann_index_kwargs=flann_index_kwargs,
+            bfmatcher_kwargs=bfmatcher_kwargs,
+            ratio_test=ratio_test,
+        )
+        # keep the same reprojection tolerance in full resolution pixels
+        homog, n_inliers = _find_homography(keypoints_src, keypoints_dst, matches, 5.0 * detect_scale)
+        if n_inliers >= _MIN_INLIERS:
+            break
+        logger.info(f"Found {n_inliers} homography inliers using {nfeatures} ORB features.")
 
-    matched_vis = cv2.drawMatches(src_preview, keypoints_src, dst_preview, keypoints_dst, matches, None)
+    matched_vis = cv2.drawMatches(detect_src, keypoints_src, detect_dst, keypoints_dst, matches, None)
     matched_vis = imutils.resize(matched_vis, width=1_000)
 
     try:
-        pts_src = np.array([keypoints_src[m.queryIdx].pt for m in matches]).reshape(-1, 1, 2)
-        pts_dst = np.array([keypoints_dst[m.trainIdx].pt for m in matches]).reshape(-1, 1, 2)
-        homog, _ = cv2.findHomography(pts_src, pts_dst, method=cv2.RANSAC, ransacReprojThreshold=5.0)
-
         if homog is None:
             _err = "Homography could not be found"
             raise cv2.error(_err)
 
+        homog = _lift_homography(homog, detect_scale)
         validate_homography(homog)
 
-        result_preview = cv2.warpPerspective(src_preview, homog, src_preview.shape[:2][::-1])
+        # no contiguous copy of the whole cube here, `_warp_cube` copies each 4-band tile as it goes
+        cube = src_cube.transpose("y", "x", "band").values
+        dsize = dst_preview.shape[:2][::-1]
 
-        result = xr.zeros_like(dst_cube)
-        for band in result.band:
-            result.loc[..., band] = cv2.warpPerspective(
-                src_cube.sel(band=band).values, homog, dst_preview.shape[:2][::-1], borderValue=-999
-            )
-        result = xr.DataArray(result, dims=dst_cube.dims, coords=dst_cube.coords)
+        # Warp the preview as part of the cube warp unless its geometry differs from the cube's
+        if src_preview.shape == cube.shape[:2] == dst_preview.shape:
+            warped_cube, warped_preview = _warp_cube(cube, homog, dsize, preview=src_preview)
+            result_preview = np.clip(np.rint(warped_preview), 0, 255).astype(np.uint8)
+        else:
+            warped_cube, _ = _warp_cube(cube, homog, dsize)
+            result_preview = cv2.warpPerspective(src_preview, homog, src_preview.shape[:2][::-1])
+
+        result = xr.DataArray(warped_cube, dims=dst_cube.dims, coords=dst_cube.coords)
     except cv2.error as err:
         warn(err.msg, stacklevel=2)
         return None, None, matched_vis
 
     if crop_registered:
-        _border_crop = 0
-        while np.any(result < 0):
-            result = result[1:-1, 1:-1, :]
-            _border_crop += 1
+        result, _border_crop = _crop_invalid_border(result)
         logger.info(f"Cropped {_border_crop} around edges of registered cube.")
 
     return result, result_preview, matched_vis
 
 
+@functools.lru_cache(maxsize=32)
+def _cached_preview(cube_path: Path, *, greyscale: bool = False) -> npt.NDArray:
+    """Cached `read_preview` so that flicking between captures in the cropper doesn't re-read each preview image."""
+    preview = read_preview(cube_path, greyscale=greyscale)
+    preview.flags.writeable = False
+    return preview
+
+
 class Cropper(param.Parameterized):
     image_selection = param.Selector()
     store_button = param.Action(lambda cropper: cropper.store_bounds(), label="Store bounds")
@@ -198,7 +550,7 @@ class Cropper(param.Parameterized):
         poly = {"x": x, "y": y}
         self.poly.data = [poly]  # type: ignore
         old_poly = hv.Polygons([poly]).opts(fill_color=None, line_color="orange", line_alpha=0.5)
-        im = read_preview(self.cube_paths[self.image_selection], greyscale=False)  # type: ignore
+        im = _cached_preview(self.cube_paths[self.image_selection], greyscale=False)  # type: ignore
         fig = (
             hv.RGB(np.flip(np.array(im), (0, -1)), bounds=(0, 0, *im.shape[:2]))
             .opts(invert_yaxis=True)
@@ -1,8 +1,10 @@
+import math
+
 import numpy as np
 import numpy.typing as npt
 import xarray as xr
+from numba import njit, prange
 from sklearn import decomposition as decomp
-from spectral.algorithms import spectral_angles
 
 __all__ = [
     "pca",
@@ -12,6 +14,9 @@ __all__ = [
     "pairwise_sam_similarity",
 ]
 
+# Approximate per-core L2 cache size, used to pick tile sizes that keep each block of the cube cache resident
+_L2_CACHE_BYTES = 1024 * 1024
+
 
 def pca(cube: xr.DataArray, n_components: int = 3, min_contained_var: float = 0.0) -> xr.Dataset:
     """
@@ -39,10 +44,9 @@ def pca(cube: xr.DataArray, n_components: int = 3, min_contained_var: float = 0.
 
     model = decomp.PCA()
     bands = cube.band.values
-    X = (  # noqa: N806  <- sklearn norm
-        cube.dropna("x", how="all").dropna("y", how="all").values.reshape((-1, bands.size))
-    )
-    model.fit_transform(X)
+    values = cube.values
+    X = values[~np.isnan(values).any(axis=-1)]  # noqa: N806  <- sklearn norm
+    model.fit(X)
     total_var = np.cumsum(model.explained_variance_)
     total_var /= total_var[-1]
     if min_contained_var > 0.0:
@@ -69,21 +73,23 @@ def _cosine_similarity(arr1: npt.NDArray[np.float_], arr2: npt.NDArray[np.float_
     Returns:
         An array of shape (N,) containing the cosine similarity between each pair of vectors.
     """
-    uv = np.average(arr1 * arr2, axis=1)
-    uu = np.average(np.square(arr1), axis=1)
-    vv = np.average(np.square(arr2), axis=1)
-    dist = np.fmax(np.fmin(1.0 - uv / np.sqrt(uu * vv), 2.0), 0)
-    return 1.0 - dist
+    uv = np.einsum("ij,ij->i", arr1, arr2)
+    uu = np.einsum("ij,ij->i", arr1, arr1)
+    vv = np.einsum("ij,ij->i", arr2, arr2)
+    # NOTE: fmax/fmin ignore NaN, so zero-norm vectors give -1.0 (maximally dissimilar) rather than NaN
+    return np.fmin(np.fmax(uv / np.sqrt(uu * vv), -1.0), 1.0)
 
 
-def pixelwise_cosine_similarity(cube1: npt.NDArray[np.float_], cube2: npt.NDArray[np.float_]) -> npt.NDArray[np.float_]:
+def pixelwise_cosine_similarity(
+    cube1: npt.NDArray[np.float_], cube2: npt.NDArray[np.float_]
+) -> npt.NDArray[np.float32]:
     """
     Computes the cosine similarity between two cubes.
     Args:
       cube1 (npt.NDArray[np.float_]): The first cube.
       cube2 (npt.NDArray[np.float_]): The second cube.
     Returns:
-      npt.NDArray[np.float_]: An array of shape (N,) containing the cosine similarity between each pair of vectors.
+      npt.NDArray[np.float32]: An array of shape (N,) containing the cosine similarity between each pair of vectors.
     Raises:
       ValueError: If cube1 and cube2 have different shapes.
     Examples:
@@ -94,8 +100,9 @@ def pixelwise_cosine_similarity(cube1: npt.NDArray[np.float_], cube2: npt.NDArra
              [0.988, 0.988, 0.988],
              [0.988, 0.988, 0.988]])
     """
-    arr1 = cube1.reshape((-1, cube1.shape[-1]))
-    arr2 = cube2.reshape((-1, cube2.shape[-1]))
+    # single precision is ample for reflectance spectra and halves the memory traffic of the reductions
+    arr1 = np.ascontiguousarray(cube1, dtype=np.float32).reshape((-1, cube1.shape[-1]))
+    arr2 = np.ascontiguousarray(cube2, dtype=np.float32).reshape((-1, cube2.shape[-1]))
 
     if arr1.shape != arr2.shape:
         _err = f"cube1 and cube2 must have the same shape, but got {arr1.shape} and {arr2.shape}"
@@ -104,40 +111,72 @@ def pixelwise_cosine_similarity(cube1: npt.NDArray[np.float_], cube2: npt.NDArra
     return _cosine_similarity(arr1, arr2).reshape(cube1.shape[:-1])
 
 
-def sam_similarity(arr1: npt.NDArray[np.float_], arr2: npt.NDArray[np.float_]) -> npt.NDArray[np.float_]:
+# NOTE: Only the fastmath flags needed to vectorise the reductions are enabled so that zero-norm spectra still give NaN
+@njit(parallel=True, fastmath={"reassoc", "contract", "nsz"}, cache=True, error_model="numpy")
+def _sam_kernel(arr1: npt.NDArray, arr2: npt.NDArray, out: npt.NDArray[np.floating]) -> None:
+    """Fill `out` with the SAM similarity of each pair of (y, x) spectra, reading each input cube only once.
+
+    The inputs are read in their own precision (the kernel is compiled per dtype) but accumulated in double precision.
+    """
+    for i in prange(arr1.shape[0]):
+        for j in range(arr1.shape[1]):
+            numerator = 0.0
+            denom1 = 0.0
+            denom2 = 0.0
+            for k in range(arr1.shape[2]):
+                a = float(arr1[i, j, k])
+                b = float(arr2[i, j, k])
+                numerator += a * b
+                denom1 += a * a
+                denom2 += b * b
+            ratio = numerator / math.sqrt(denom1 * denom2)
+            # clip without min/max so that a NaN ratio (zero-norm or NaN spectra) propagates to the result
+            if ratio > 1.0:
+                ratio = 1.0
+            elif ratio < -1.0:
+                ratio = -1.0
+            out[i, j] = 1.0 - math.acos(ratio)
+
+
+def sam_similarity(arr1: npt.NDArray[np.float_], arr2: npt.NDArray[np.float_]) -> npt.NDArray[np.floating]:
     """
     Computes the spectral angle mapping (SAM) similarity between two 3D arrays.
     Args:
       arr1 (npt.NDArray[np.float_]): The first 3D array.
       arr2 (npt.NDArray[np.float_]): The second 3D array.
     Returns:
-      npt.NDArray[np.float_]: The cosine similarity between arr1 and arr2.
+      npt.NDArray[np.floating]: The cosine similarity between arr1 and arr2.
+    Raises:
+      ValueError: If arr1 and arr2 do not broadcast to a common 3D shape.
     Notes:
-      The result is clipped between -1.0 and 1.0.
+      The result is clipped between -1.0 and 1.0. It is single precision if both inputs are, and double otherwise.
     Examples:
       >>> sam(arr1, arr2)
       array([[0.9, 0.8],
              [0.7, 0.6]])
     """
-    numerator = np.einsum("ijk,ijk->ij", arr1, arr2)
-    denom1 = np.einsum("ijk,ijk->ij", arr1, arr1)
-    np.sqrt(denom1, out=denom1)
-    denom2 = np.einsum("ijk,ijk->ij", arr2, arr2)
-    np.sqrt(denom2, out=denom2)
-    result = numerator / (denom1 * denom2)
-    np.clip(result, -1.0, 1.0, out=result)
-    np.arccos(result, out=result)
-    return 1.0 - result.squeeze()
-
-
-def pairwise_sam_similarity(cube: npt.NDArray[np.float_], spectra: npt.NDArray[np.float_]) -> npt.NDArray[np.float_]:
+    # The kernel indexes both arrays by the shape of arr1 without bounds checking, so broadcast them up front (this
+    # raises for incompatible shapes, and lets a single reference spectrum be compared against a whole cube)
+    arr1, arr2 = np.broadcast_arrays(arr1, arr2)
+    if arr1.ndim != 3:
+        _err = f"arr1 and arr2 must broadcast to 3 dimensions, but got {arr1.shape}"
+        raise ValueError(_err)
+    # pass float32 cubes through as they are (rather than casting) to halve the bytes read by the kernel
+    arr1 = np.ascontiguousarray(arr1)
+    arr2 = np.ascontiguousarray(arr2)
+    result = np.empty(arr1.shape[:2], dtype=np.result_type(arr1, arr2, np.float32))
+    _sam_kernel(arr1, arr2, result)
+    return result.squeeze()
+
+
+def pairwise_sam_similarity(cube: npt.NDArray[np.float_], spectra: npt.NDArray[np.float_]) -> npt.NDArray[np.float32]:
     """
     Computes the pairwise spectral angle mapping (SAM) similarity between a cube and array of spectra.
     Args:
       cube (npt.NDArray[np.float_]): A 3-dimensional cube.
       spectra (npt.NDArray[np.float_]): A 1- or 2-dimensional array of spectra.
     Returns:
-      npt.NDArray[np.float_]: The pairwise SAM between cube and spectra.
+      npt.NDArray[np.float32]: The pairwise SAM between cube and spectra.
     Raises:
       ValueError: If cube does not have 3 dimensions or spectra does not have ≤2 dimensions.
     Examples:
@@ -155,7 +194,26 @@ def pairwise_sam_similarity(cube: npt.NDArray[np.float_], spectra: npt.NDArray[n
         raise ValueError(_err)
     if spectra.ndim == 1:
         spectra = spectra[None, :]
-    return 1.0 - spectral_angles(cube, spectra)
+
+    spectra = np.asarray(spectra, dtype=np.float64)
+    norm_spectra = np.sqrt(np.einsum("nk,nk->n", spectra, spectra))
+
+    # Process the cube in blocks of rows small enough to stay in cache while they are reduced against every spectrum.
+    # Each block is accumulated in double precision, as arccos amplifies rounding errors in the ratio near cos≈1 and
+    # the angles between similar spectra would otherwise be dominated by them; only the result is single precision.
+    height, width, n_bands = cube.shape
+    tile = max(1, _L2_CACHE_BYTES // 2 // (width * n_bands * np.dtype(np.float64).itemsize))
+    result = np.empty((height, width, spectra.shape[0]), dtype=np.float32)
+    for y0 in range(0, height, tile):
+        y1 = min(height, y0 + tile)
+        rows = np.asarray(cube[y0:y1], dtype=np.float64)
+        block = np.einsum("ijk,nk->ijn", rows, spectra)
+        block /= np.sqrt(np.einsum("ijk,ijk->ij", rows, rows))[..., None]
+        block /= norm_spectra
+        np.clip(block, -1.0, 1.0, out=block)
+        np.arccos(block, out=block)
+        np.subtract(1.0, block, out=result[y0:y1])
+    return result
 
 
 def pixelwise_sam_similarity(arr1: npt.NDArray[np.float_], arr2: npt.NDArray[np.float_]) -> npt.NDArray[np.float_]:
@@ -0,0 +1,283 @@
+import cv2
+import numpy as np
+import pytest
+import xarray as xr
+from scipy.ndimage import gaussian_filter
+
+from hyperspec import registration
+from hyperspec.registration import (
+    FeatureCache,
+    _crop_invalid_border,
+    _lift_homography,
+    _warp_cube,
+    register,
+    validate_homography,
+)
+
+HOMOG = np.array([[1.0, 0.01, 4.0], [-0.01, 1.0, -3.0], [0.0, 0.0, 1.0]])
+
+
+def _scene(size=300, n_bands=5, seed=0):
+    """A textured destination image and cube, and the source versions displaced by the inverse of HOMOG."""
+    rng = np.random.default_rng(seed)
+    texture = gaussian_filter(rng.random((size, size)), 2)
+    dst_preview = ((texture - texture.min()) / np.ptp(texture) * 255).astype(np.uint8)
+    src_preview = cv2.warpPerspective(dst_preview, np.linalg.inv(HOMOG), (size, size), borderMode=cv2.BORDER_REFLECT)
+
+    def _cube(preview):
+        values = np.stack([preview.astype(np.float32) / 255 * (1 + 0.1 * b) for b in range(n_bands)], -1)
+        return xr.DataArray(
+            values,
+            dims=("y", "x", "band"),
+            coords={"y": np.arange(size), "x": np.arange(size), "band": 0.5 + 0.1 * np.arange(n_bands)},
+        )
+
+    return dst_preview, _cube(dst_preview), src_preview, _cube(src_preview)
+
+
+@pytest.mark.parametrize("n_bands", range(1, 10))
+def test_warp_cube(n_bands):
+    rng = np.random.default_rng(n_bands)
+    cube = rng.random((40, 50, n_bands)).astype(np.float32)
+    warped, warped_preview = _warp_cube(cube, HOMOG, (50, 40))
+    expected = np.stack(
+        [
+            cv2.warpPerspective(np.ascontiguousarray(cube[..., b]), HOMOG, (50, 40), borderValue=-999)
+            for b in range(n_bands)
+        ],
+        -1,
+    )
+    np.testing.assert_array_equal(warped, expected)
+    assert warped_preview is None
+
+
+@pytest.mark.parametrize("n_bands", range(1, 10))
+def test_warp_cube_with_preview(n_bands):
+    rng = np.random.default_rng(n_bands)
+    cube = rng.random((40, 50, n_bands)).astype(np.float32)
+    preview = (rng.random((40, 50)) * 255).astype(np.uint8)
+    warped, warped_preview = _warp_cube(cube, HOMOG, (50, 40), preview=preview)
+    np.testing.assert_array_equal(warped, _warp_cube(cube, HOMOG, (50, 40))[0])
+    expected = cv2.warpPerspective(preview.astype(np.float32), HOMOG, (50, 40), borderValue=-999)
+    np.testing.assert_allclose(warped_preview, expected, atol=1e-3)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_crop_invalid_border(seed):
+    rng = np.random.default_rng(seed)
+    values = rng.random((30, 25, 3))
+    n_invalid = rng.integers(0, 10)
+    values[rng.integers(0, 30, n_invalid), rng.integers(0, 25, n_invalid), rng.integers(0, 3, n_invalid)] = -999
+    cube = xr.DataArray(values, dims=("y", "x", "band"))
+
+    # reference: the original one-pixel-at-a-time loop
+    expected, expected_border = cube, 0
+    while np.any(expected < 0):
+        expected = expected[1:-1, 1:-1, :]
+        expected_border += 1
+
+    cropped, border = _crop_invalid_border(cube)
+    assert border == expected_border
+    xr.testing.assert_identical(cropped, expected)
+
+
+def test_lift_homography():
+    # a one pixel shift between half resolution previews is a two pixel shift at full resolution
+    shift = np.array([[1.0, 0.0, 1.0], [0.0, 1.0, -1.0], [0.0, 0.0, 1.0]])
+    np.testing.assert_allclose(_lift_homography(shift, 0.5), [[1.0, 0.0, 2.0], [0.0, 1.0, -2.0], [0.0, 0.0, 1.0]])
+    np.testing.assert_allclose(_lift_homography(HOMOG, 1.0), HOMOG)
+
+    # lifted homography maps full resolution points to where the resized homography sends their resized positions
+    scale = 0.25
+    points = np.array([[[0.0, 0.0], [10.0, 3.0], [57.5, 120.0], [200.0, 80.0]]])
+    to_resized = (points + 0.5) * scale - 0.5
+    expected = (cv2.perspectiveTransform(to_resized, HOMOG) + 0.5) / scale - 0.5
+    np.testing.assert_allclose(cv2.perspectiveTransform(points, _lift_homography(HOMOG, scale)), expected)
+
+
+@pytest.mark.parametrize(
+    "homog",
+    [
+        HOMOG,
+        np.array([[1.05, 0.02, 10.0], [0.0, 0.97, -5.0], [1e-4, -2e-4, 1.0]]),
+        np.array([[np.cos(0.3), -np.sin(0.3), 0.0], [np.sin(0.3), np.cos(0.3), 0.0], [0.0, 0.0, 1.0]]),
+    ],
+)
+def test_validate_homography(homog):
+    validate_homography(homog)
+
+
+@pytest.mark.parametrize(
+    ("homog", "match"),
+    [
+        (np.diag([1.2, 1.2, 1.0]), "area"),
+        (np.diag([0.9, 0.9, 1.0]), "area"),
+        (np.diag([-1.0, 1.0, 1.0]), "orientation"),
+        (np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.01, 0.0, 1.0]]), "perspective"),
+    ],
+)
+def test_validate_homography_invalid(homog, match):
+    with pytest.raises(ValueError, match=match):
+        validate_homography(homog)
+
+
+def test_validate_homography_area_matches_opencv():
+    # rescale a homography so that its area (measured with OpenCV) lies just inside / outside the 10% tolerance
+    homog = np.array([[1.04, 0.03, 3.0], [-0.02, 0.99, 2.0], [1e-4, -2e-4, 1.0]])
+    corners = np.array([[[0, 0], [1, 0], [1, 1], [0, 1]]], np.float32)
+    area = cv2.contourArea(cv2.perspectiveTransform(corners, homog).squeeze())
+    validate_homography(homog @ np.diag([np.sqrt(1.09 / area), np.sqrt(1.09 / area), 1.0]))
+    with pytest.raises(ValueError, match="area"):
+        validate_homography(homog @ np.diag([np.sqrt(1.11 / area), np.sqrt(1.11 / area), 1.0]))
+
+
+@pytest.mark.parametrize("use_flann", [False, True])
+def test_register(use_flann):
+    dst_preview, dst_cube, src_preview, src_cube = _scene()
+    result, result_preview, matched_vis = register(dst_preview, dst_cube, src_preview, src_cube, use_flann=use_flann)
+
+    assert result is not None
+    assert result_preview is not None
+    assert result_preview.dtype == np.uint8
+    assert result_preview.shape == dst_preview.shape
+    assert matched_vis.ndim == 3
+    assert not np.any(result.values < 0)
+
+    # the registered cube should line up with the matching (symmetrically cropped) region of the destination
+    crop = (dst_cube.shape[0] - result.shape[0]) // 2
+    expected = dst_cube.values[crop : dst_cube.shape[0] - crop, crop : dst_cube.shape[1] - crop]
+    assert np.abs(result.values - expected)[5:-5, 5:-5].mean() < 0.02
+    np.testing.assert_array_equal(result.band, dst_cube.band)
+
+
+@pytest.mark.parametrize("use_flann", [False, True])
+def test_register_no_features(use_flann):
+    blank = np.zeros((100, 100), np.uint8)
+    cube = xr.DataArray(np.zeros((100, 100, 3), np.float32), dims=("y", "x", "band"))
+    with pytest.warns(UserWarning):
+        result, result_preview, _ = register(blank, cube, blank, cube, use_flann=use_flann)
+    assert result is None
+    assert result_preview is None
+
+
+@pytest.fixture
+def orb_nfeatures(monkeypatch):
+    """Record the feature budget of every ORB detector created."""
+    calls = []
+    orb_create = cv2.ORB_create
+
+    def _orb_create(**kwargs):
+        calls.append(kwargs["nfeatures"])
+        return orb_create(**kwargs)
+
+    monkeypatch.setattr(cv2, "ORB_create", _orb_create)
+    return calls
+
+
+def test_register_feature_budget(orb_nfeatures):
+    register(*_scene())
+    assert orb_nfeatures == [registration._INITIAL_NFEATURES]
+
+
+def test_register_feature_budget_escalates(orb_nfeatures, monkeypatch):
+    # too few inliers in the first pass retries with the full budget
+    monkeypatch.setattr(registration, "_MIN_INLIERS", 10**6)
+    result, _, _ = register(*_scene())
+    assert orb_nfeatures == [registration._INITIAL_NFEATURES, registration._ORB_CREATE_DEFAULTS["nfeatures"]]
+    assert result is not None
+
+
+@pytest.mark.parametrize("fixed", ["nfeatures", "src_features", "dst_features"])
+def test_register_feature_budget_fixed(fixed, orb_nfeatures, monkeypatch):
+    # a caller-specified budget or precomputed features are matched in a single pass
+    monkeypatch.setattr(registration, "_MIN_INLIERS", 10**6)
+    dst_preview, dst_cube, src_preview, src_cube = _scene()
+    if fixed == "nfeatures":
+        kwargs = {"orb_create_kwargs": {"nfeatures": 3_000}}
+    elif fixed == "src_features":
+        kwargs = {"src_features": registration.detect_features(src_preview)}
+    else:
+        kwargs = {"dst_features": registration.detect_features(dst_preview)}
+    orb_nfeatures.clear()
+    register(dst_preview, dst_cube, src_preview, src_cube, **kwargs)
+    expected = 3_000 if fixed == "nfeatures" else registration._ORB_CREATE_DEFAULTS["nfeatures"]
+    assert orb_nfeatures == [expected]
+
+
+class _CountingDetect:
+    def __init__(self, preview):
+        self.preview = preview
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return registration.detect_features(self.preview)
+
+
+def test_feature_cache():
+    previews = [_scene(size=120, seed=seed)[0] for seed in range(3)]
+    detects = [_CountingDetect(preview) for preview in previews]
+    cache = FeatureCache(maxsize=2)
+
+    # miss, then hit for the same array and settings
+    features = cache.get(previews[0], ("a",), detects[0])
+    assert cache.get(previews[0], ("a",), detects[0]) is features
+    assert detects[0].calls == 1
+
+    # different settings or a copy of the array are separate entries
+    cache.get(previews[0], ("b",), detects[0])
+    assert detects[0].calls == 2
+    cache.get(previews[0].copy(), ("b",), detects[0])
+    assert detects[0].calls == 3
+
+    # least recently used entries are evicted beyond maxsize
+    cache.get(previews[1], ("a",), detects[1])
+    cache.get(previews[2], ("a",), detects[2])
+    cache.get(previews[1], ("a",), detects[1])
+    assert detects[1].calls == 1
+    cache.get(previews[0], ("a",), detects[0])
+    assert detects[0].calls == 4
+
+
+def test_feature_cache_directory(tmp_path):
+    preview = _scene(size=120)[0]
+    detect = _CountingDetect(preview)
+    keypoints, descriptors = FeatureCache(directory=tmp_path).get(preview, ("a",), detect)
+    assert len(list(tmp_path.iterdir())) == 1
+
+    # a new cache (e.g. another process) reloads the stored features for the same content and settings
+    cached_keypoints, cached_descriptors = FeatureCache(directory=tmp_path).get(preview.copy(), ("a",), detect)
+    assert detect.calls == 1
+    np.testing.assert_array_equal(cached_descriptors, descriptors)
+    np.testing.assert_allclose(cv2.KeyPoint_convert(cached_keypoints), cv2.KeyPoint_convert(keypoints))
+    assert [kp.octave for kp in cached_keypoints] == [kp.octave for kp in keypoints]
+
+    FeatureCache(directory=tmp_path).get(preview, ("b",), detect)
+    assert detect.calls == 2
+    # only the finished feature files are left in the directory
+    assert sorted(path.suffix for path in tmp_path.iterdir()) == [".npz", ".npz"]
+
+
+def test_feature_cache_directory_interrupted_write(tmp_path, monkeypatch):
+    def _fail(fp, **_):
+        fp.write(b"partial")
+        raise OSError
+
+    monkeypatch.setattr(np, "savez", _fail)
+    preview = _scene(size=120)[0]
+    with pytest.raises(OSError):
+        FeatureCache(directory=tmp_path).get(preview, ("a",), _CountingDetect(preview))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_register_feature_cache(monkeypatch):
+    dst_preview, dst_cube, src_preview, src_cube = _scene()
+    cache = FeatureCache()
+    register(dst_preview, dst_cube, src_preview, src_cube, feature_cache=cache)
+
+    def _fail(*_):
+        raise AssertionError
+
+    monkeypatch.setattr(registration, "_detect", _fail)
+    result, _, _ = register(dst_preview, dst_cube, src_preview, src_cube, feature_cache=cache)
+    assert result is not None
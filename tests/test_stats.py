@@ -1,9 +1,18 @@
 import numpy as np
+import pytest
+import xarray as xr
 from numpy.testing import assert_array_almost_equal
 from scipy.spatial import distance
 from spectral.algorithms import spectral_angles
 
-from hyperspec.stats import _cosine_similarity, pairwise_sam_similarity, pixelwise_sam_similarity
+from hyperspec import stats
+from hyperspec.stats import (
+    _cosine_similarity,
+    pairwise_sam_similarity,
+    pca,
+    pixelwise_sam_similarity,
+    sam_similarity,
+)
 
 
 def test_cosine_similarity():
@@ -21,6 +30,14 @@ def test_cosine_similarity():
     assert_array_almost_equal(actual_similarity, expected_similarity)
 
 
+def test_cosine_similarity_zero_norm():
+    arr1 = np.array([[0.0, 0.0, 0.0], [1.0, 2.0, 3.0]])
+    arr2 = np.array([[4.0, 5.0, 6.0], [4.0, 5.0, 6.0]])
+    with np.errstate(invalid="ignore"):
+        similarity = _cosine_similarity(arr1, arr2)
+    assert_array_almost_equal(similarity, [-1.0, 1.0 - distance.cosine(arr1[1], arr2[1])])
+
+
 def test_pixelwise_sam_similarity():
     cube1 = np.random.rand(4, 4, 4)
     cube2 = np.ones(cube1.shape) * cube1[0, 0]
@@ -29,9 +46,78 @@ def test_pixelwise_sam_similarity():
     np.testing.assert_array_almost_equal(sam1, sam2)
 
 
+def test_sam_similarity():
+    arr1 = np.random.rand(5, 3, 6)
+    arr2 = np.random.rand(5, 3, 6)
+    cos = np.einsum("ijk,ijk->ij", arr1, arr2) / (np.linalg.norm(arr1, axis=-1) * np.linalg.norm(arr2, axis=-1))
+    expected = 1.0 - np.arccos(np.clip(cos, -1.0, 1.0))
+    np.testing.assert_array_almost_equal(sam_similarity(arr1, arr2), expected)
+
+
+def test_sam_similarity_broadcast():
+    arr1 = np.random.rand(5, 3, 6)
+    reference = np.random.rand(1, 1, 6)
+    expected = 1.0 - spectral_angles(arr1, reference[0]).squeeze()
+    np.testing.assert_array_almost_equal(sam_similarity(arr1, reference), expected)
+
+
+@pytest.mark.parametrize("shape", [(2, 3, 6), (5, 3, 4), (5, 3)])
+def test_sam_similarity_shape_mismatch(shape):
+    with pytest.raises(ValueError):
+        sam_similarity(np.random.rand(5, 3, 6), np.random.rand(*shape))
+
+
+def test_sam_similarity_invalid_spectra():
+    arr1 = np.random.rand(2, 2, 3)
+    arr2 = np.random.rand(2, 2, 3)
+    arr1[0, 0] = 0.0
+    arr2[1, 1, 1] = np.nan
+    with np.errstate(invalid="ignore"):
+        sam = sam_similarity(arr1, arr2)
+    assert np.isnan(sam[0, 0])
+    assert np.isnan(sam[1, 1])
+    assert np.all(np.isfinite(sam[[0, 1], [1, 0]]))
+
+
 def test_pairwise_sam_similarity():
     cube = np.random.rand(4, 4, 4)
     spectra = np.random.rand(4, 4)
     sam1 = pairwise_sam_similarity(cube, spectra)
     sam2 = 1.0 - spectral_angles(cube, spectra)
     np.testing.assert_array_almost_equal(sam1, sam2)
+
+
+def test_pairwise_sam_similarity_tiled(monkeypatch):
+    # force several row tiles, including a ragged final tile
+    monkeypatch.setattr(stats, "_L2_CACHE_BYTES", 2 * 5 * 6 * 8 * 3)
+    cube = np.random.rand(7, 5, 6)
+    spectra = np.random.rand(3, 6)
+    sam1 = pairwise_sam_similarity(cube, spectra)
+    sam2 = 1.0 - spectral_angles(cube, spectra)
+    np.testing.assert_array_almost_equal(sam1, sam2)
+
+
+def test_pairwise_sam_similarity_similar_spectra():
+    # angles of a few milliradians are sensitive to rounding in the cosine, so check against the float64 reference
+    rng = np.random.default_rng(0)
+    spectra = rng.random((3, 300))
+    cube = spectra[0] * (1.0 + rng.normal(0, 0.002, (6, 5, 300)))
+    sam1 = pairwise_sam_similarity(cube, spectra)
+    sam2 = 1.0 - spectral_angles(cube, spectra)
+    np.testing.assert_allclose(sam1, sam2, atol=1e-6)
+
+
+def test_pca_ignores_nan_pixels():
+    cube = np.random.rand(6, 5, 4)
+    padded = np.full((8, 7, 4), np.nan)
+    padded[1:-1, 1:-1] = cube
+    padded[3, 3, 2] = np.nan
+    bands = np.arange(4)
+
+    mask = np.ones(cube.shape[:2], bool)
+    mask[2, 2] = False
+    expected = pca(xr.DataArray(cube[mask][:, None, :], dims=("y", "x", "band"), coords={"band": bands}))
+    actual = pca(xr.DataArray(padded, dims=("y", "x", "band"), coords={"band": bands}))
+    for ii in expected:
+        # components are only defined up to a sign
+        assert_array_almost_equal(np.abs(actual[ii].values), np.abs(expected[ii].values))